@@ -1,8 +1,31 @@
-from sqlalchemy import create_engine, MetaData, Table, Column, Integer, String, Float, DateTime, Text, ForeignKey, Date, insert, select, func
+from sqlalchemy import create_engine, MetaData, Table, Column, Integer, String, Float, DateTime, Text, ForeignKey, Date, insert, select, func, event, Index
 import json
-from datetime import date
-engine = create_engine('sqlite:///data.db', echo=False)
-conn = engine.connect()
+from datetime import date, datetime
+from functools import lru_cache
+from contextlib import contextmanager
+# Each function checks out its own pooled connection; Flask may serve requests from any thread
+engine = create_engine('sqlite:///data.db', echo=False, connect_args={'check_same_thread': False}, pool_size=8, max_overflow=16)
+
+# WAL + relaxed sync: commits append to the WAL instead of fsyncing a rollback journal
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_conn, _):
+    cursor = dbapi_conn.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA cache_size=-20000")
+    cursor.execute("PRAGMA mmap_size=268435456")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
+# pysqlite only emits BEGIN right before DML, so SELECTs in engine.begin() would run in autocommit.
+# Writers take the write lock up front so their reads see the same snapshot the insert commits against.
+@contextmanager
+def _write_tx():
+    with engine.begin() as tx:
+        tx.exec_driver_sql("BEGIN IMMEDIATE")
+        yield tx
+
 meta = MetaData()
 subDomains = Table('subDomains', meta,
     Column('id', Integer, primary_key=True),
@@ -38,113 +61,187 @@ responses = Table('responses', meta,
     Column('Response', Integer)
 )
 
-meta.create_all(engine)
+# Named counters, so res-id allocation is one UPDATE ... RETURNING instead of a MAX() scan
+sequences = Table('sequences', meta,
+    Column('name', String, primary_key=True),
+    Column('val', Integer)
+)
+
+# Hot filters: layout lookups, the current-year window in response inserts, and MAX(res-id)
+Index('ix_questions_layout', questions.c.layout_id, questions.c.Domain, questions.c.SubDomain)
+Index('ix_questions_year', questions.c.year_start, questions.c.year_end, questions.c.Domain)
+Index('ix_responses_res_id', responses.c['res-id'])
+
+# Bump whenever a table or index above changes so existing databases pick it up
+SCHEMA_VERSION = 1
+
+# Warm path: PRAGMA user_version records the last schema applied, so an up-to-date database costs one
+# lock-free read on a plain connection and never waits on a writer.
+with engine.connect() as _version_conn:
+    _schema_current = _version_conn.exec_driver_sql('PRAGMA user_version').scalar() >= SCHEMA_VERSION
+
+# Cold path: take the write lock, re-check (another worker may have migrated meanwhile), then run the DDL
+# and version stamp in one BEGIN IMMEDIATE transaction so concurrent workers serialize here.
+if not _schema_current:
+    with _write_tx() as _schema_conn:
+        if _schema_conn.exec_driver_sql('PRAGMA user_version').scalar() < SCHEMA_VERSION:
+            meta.create_all(_schema_conn)
+            # create_all only emits indexes for tables it creates, so backfill them on existing databases
+            for index in (*questions.indexes, *responses.indexes):
+                index.create(_schema_conn, checkfirst=True)
+            _schema_conn.exec_driver_sql(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+# Built once so every call hits the same compiled-statement cache entry
+_INSERT_QUESTIONS = insert(questions)
+# Responses go straight to the driver as positional tuples; Date is stored as ISO text like SQLAlchemy's Date type
+_INSERT_RESPONSES_SQL = 'INSERT INTO responses ("res-id", "School", "Grade", "Teacher", "Assessment", "Name", "Date", "Index_ID", "Response") VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)'
+
+
+# Layout payloads repeat the same few dates on every row, so parse each string once
+@lru_cache(maxsize=4096)
+def _to_date(val):
+    if isinstance(val, datetime):
+        return val.date()
+    if val is None or isinstance(val, date):
+        return val
+    try:
+        return date.fromisoformat(val)
+    except ValueError:
+        return datetime.fromisoformat(val).date()
+
+# Keyed by (date, layout_version): the version row in `sequences` is bumped by every questions
+# write, so a layout change made by any process invalidates every process's cache
+_meta_cache = {"date": None, "version": None, "valid": None, "meta": None}
+
+def _refresh_meta_cache(tx, today, version):
+    # One pass over the current-year questions feeds both the valid Index_ID set and the metadata map
+    meta_elements = {"School", "Grade", "Teacher", "Assessment", "Name", "Date"}
+    s = select(questions.c.Index_ID, questions.c.SubDomain, questions.c.Domain).where(
+        (questions.c.year_start <= today) &
+        (questions.c.year_end >= today)
+    )
+    rows = tx.execute(s).all()
+
+    valid_index_set = {row.Index_ID for row in rows if row.Domain not in (None, "MetaData")}
+    # Map SubDomain to Index_ID
+    meta_index_map = {row.SubDomain: row.Index_ID for row in rows if row.SubDomain in meta_elements}
+
+    _meta_cache.update(date=today, version=version, valid=valid_index_set, meta=meta_index_map)
+
+
+def _bump_sequence(tx, name, count=1, seed_query=None):
+    # Advance counter `name` by `count` and return its new value
+    bump = sequences.update().where(sequences.c.name == name).values(val=sequences.c.val + count).returning(sequences.c.val)
+    val = tx.execute(bump).scalar()
+    if val is None:
+        # Seed lazily (e.g. from existing rows) so counters carry on where the data left off
+        current = tx.execute(seed_query).scalar() if seed_query is not None else None
+        val = (current or 0) + count
+        tx.execute(sequences.insert().values(name=name, val=val))
+    return val
+
+def _layout_version(tx):
+    return tx.execute(select(sequences.c.val).where(sequences.c.name == 'layout_version')).scalar()
+
+def _allocate_res_ids(tx, count):
+    # Reserve `count` consecutive res-ids and return the first one
+    last = _bump_sequence(tx, 'res_id', count, select(func.max(responses.c['res-id'])))
+    return last - count + 1
 
 
 def insert_response(json_data):
+    insert_responses_bulk([json_data])
+
+def insert_responses_bulk(datas):
     values_list = []
-    query = insert(responses)
 
     today = date.today()
-    if isinstance(json_data, str):
-        data = json.loads(json_data)
-    else:
-        data = json_data
-    
-    # SQLAlchemy way to get MAX(res_id)
-    max_query = select(func.max(responses.c.res_id))
-    result = conn.execute(max_query).fetchone()
-    next_res_id = (result[0] + 1) if result[0] is not None else 1
-    
-    # SQLAlchemy way to get valid Index_IDs
-    s = questions.select().where((questions.c.year_start <= today) & (questions.c.year_end >= today) & (questions.c.Domain != "MetaData")).distinct()
-    valid_index = conn.execute(s).fetchall()
-    valid_index_set = {row[5] for row in valid_index}
-
-    # Efficiently map metadata elements to their Index_IDs
-    meta_elements = ["School", "Grade", "Teacher", "Assessment", "Name", "Date"]
-    meta_query = questions.select().where(
-        (questions.c.year_start <= today) &
-        (questions.c.year_end >= today) &
-        (questions.c.SubDomain.in_(meta_elements))
-    ).distinct()
-    meta_rows = conn.execute(meta_query).fetchall()
+    datas = [json.loads(d) if isinstance(d, str) else d for d in datas]
+    if not datas:
+        return
 
-    # Map SubDomain to Index_ID
-    meta_index_map = {row[5]: row[6] for row in meta_rows}  # row[5]=SubDomain, row[6]=Index_ID
-
-    # Assign variables for each metadata element
-    school_index = meta_index_map.get("School")
-    grade_index = meta_index_map.get("Grade")
-    teacher_index = meta_index_map.get("Teacher")
-    assessment_index = meta_index_map.get("Assessment")
-    name_index = meta_index_map.get("Name")
-    date_index = meta_index_map.get("Date")
-    school = data[school_index]
-    grade = data[grade_index]
-    teacher = data[teacher_index]
-    assessment = data[assessment_index]
-    name = data[name_index]
-    date_val = data[date_index]
-    
-    for index, value in enumerate(data):
-        index_id = index + 1
-
-        if index_id in valid_index_set:
-            row = {
-                'res-id': next_res_id,
-                'School': school,
-                'Grade': grade,
-                'Teacher': teacher,
-                'Assessment': assessment,
-                'Name': name,
-                'Date': date_val,
-                'Index_ID': index_id,
-                'Response': value
-            }
-            values_list.append(row)
-    if values_list:
-        conn.execute(query,values_list)
+    with _write_tx() as tx:
+        # Each submission gets the next id in one reserved range
+        next_res_id = _allocate_res_ids(tx, len(datas))
+
+        # Layout lookups only change when the date rolls over or a layout is written
+        version = _layout_version(tx)
+        if _meta_cache["date"] != today or _meta_cache["version"] != version:
+            _refresh_meta_cache(tx, today, version)
+        valid_index_set = _meta_cache["valid"]
+        meta_index_map = _meta_cache["meta"]
+
+        # Assign variables for each metadata element (Index_ID is 1-based, data is 0-based)
+        school_index = meta_index_map.get("School")
+        grade_index = meta_index_map.get("Grade")
+        teacher_index = meta_index_map.get("Teacher")
+        assessment_index = meta_index_map.get("Assessment")
+        name_index = meta_index_map.get("Name")
+        date_index = meta_index_map.get("Date")
+
+        for offset, data in enumerate(datas):
+            date_val = _to_date(data[date_index - 1])
+            # Metadata is the same for every row of a submission; only Index_ID/Response vary
+            template = (
+                next_res_id + offset,
+                data[school_index - 1],
+                data[grade_index - 1],
+                data[teacher_index - 1],
+                data[assessment_index - 1],
+                data[name_index - 1],
+                date_val.isoformat() if date_val is not None else None,
+            )
+            values_list += [(*template, index + 1, value) for index, value in enumerate(data) if index + 1 in valid_index_set]
+        if values_list:
+            tx.exec_driver_sql(_INSERT_RESPONSES_SQL, values_list)
 
 def insert_layout(json_data):
-    query = insert(questions)
-    read = select(func.max(questions.c.layout_id))
-    result = conn.execute(read).fetchone()
-    layout_id = (result[0] + 1) if result[0] is not None else 1
-
-    values = []
-    for item in json_data:
-        values.append({
-            'year_start': item['year_start'],
-            'year_end': item['year_end'],
-            'Domain': item['Domain'],
-            'SubDomain': item['SubDomain'],
-            'Index_ID': item['Index_ID'],
-            'Name': item['Name'],
-            'Date edited': item['Date edited'],
-            'layout_id': layout_id,
-            'layout_name': item['layout_name']
-        })
-    if values:
-        conn.execute(query, values)
+    with _write_tx() as tx:
+        read = select(func.max(questions.c.layout_id))
+        result = tx.execute(read).fetchone()
+        layout_id = (result[0] + 1) if result[0] is not None else 1
+
+        values = []
+        for item in json_data:
+            values.append({
+                'year_start': _to_date(item['year_start']),
+                'year_end': _to_date(item['year_end']),
+                'Domain': item['Domain'],
+                'SubDomain': item['SubDomain'],
+                'Index_ID': item['Index_ID'],
+                'Name': item['Name'],
+                'Date edited': _to_date(item['Date edited']),
+                'layout_id': layout_id,
+                'layout_name': item['layout_name']
+            })
+        if values:
+            tx.execute(_INSERT_QUESTIONS, values)
+            _bump_sequence(tx, 'layout_version')
 
 def update_layout(layout_id, json_data):
     query = questions.update().where(questions.c.layout_id == json_data['layout_id'])
     values = {
-        'year_start': json_data['year_start'],
-        'year_end': json_data['year_end'],
+        'year_start': _to_date(json_data['year_start']),
+        'year_end': _to_date(json_data['year_end']),
         'Domain': json_data['Domain'],
         'SubDomain': json_data['SubDomain'],
         'Index_ID': json_data['Index_ID'],
         'Name': json_data['Name'],
-        'Date edited': json_data['Date edited'],
+        'Date edited': _to_date(json_data['Date edited']),
         'layout_name': json_data['layout_name']
     }
-    conn.execute(query.values(values))
+    with _write_tx() as tx:
+        tx.execute(query.values(values))
+        _bump_sequence(tx, 'layout_version')
 
 def fetch_questions(request=None):
     query = select(questions)
     if request is not None:
         query = query.where(questions.c.layout_id == request)
-    result = conn.execute(query).fetchall()
-    return [dict(row) for row in result]
\ No newline at end of file
+    # ix_questions_layout would otherwise return rows in Domain/SubDomain order
+    query = query.order_by(questions.c.id)
+    # Stream rows to the caller instead of materializing the whole layout
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True).execute(query)
+        for row in result:
+            yield dict(row._mapping)
\ No newline at end of file